@@ -1,14 +1,209 @@
+import asyncio
 import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+from functools import lru_cache
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from geopy.adapters import RequestsAdapter
+from geopy.exc import GeopyError
+from geopy.extra.rate_limiter import RateLimiter
 from geopy.geocoders import Nominatim
 
+# Classification and PM2.5 AQI tables, generated from data/*.csv by scripts/gen_aq_tables.py.
+from _aq_tables import (
+    AQ_TABLE as _AQ_TABLE,
+    AQ_PARAMETERS as _AQ_PARAMETERS,
+    AQI_BP as _AQI_BP,
+    AQI_BPL as _AQI_BPL,
+    AQI_IL as _AQI_IL,
+    AQI_SLOPE as _AQI_SLOPE,
+)
+
+_USER_AGENT = "ZipToAirQuality/1.0 (+https://github.com/williamdwinnell/Air-Quality-from-Zip-Code-with-OpenAQ)"
+
+# Shared HTTP session so repeated calls to the OpenAQ API reuse pooled connections
+# instead of opening a new TCP/TLS connection for every request. Idempotent GETs are retried
+# with exponential backoff, and every request sets connect/read timeouts (see _fetch_air_quality).
+# A Retry-After from a throttled (429/503) response is honoured, but capped so it can't stall a call indefinitely.
+class _CappedRetry(Retry):
+    MAX_RETRY_AFTER = 5 # seconds
+
+    def parse_retry_after(self, retry_after):
+        return min(super().parse_retry_after(retry_after), self.MAX_RETRY_AFTER)
+
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=_CappedRetry(
+        total=3,
+        connect=2,
+        read=2,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+    ),
+))
+_SESSION.headers.update({"User-Agent": _USER_AGENT})
+
+# A single geocoder for the whole module so its underlying HTTP session is reused. Nominatim's usage policy asks for
+# a user agent that identifies the application; the requests adapter keeps its connection alive between lookups.
+_GEOLOCATOR = Nominatim(user_agent=_USER_AGENT, adapter_factory=RequestsAdapter)
+
+# Nominatim allows at most 1 request per second. Errors are raised rather than swallowed so a failed lookup
+# is not cached as an invalid zip code.
+_rate_limited_geocode = RateLimiter(_GEOLOCATOR.geocode, min_delay_seconds=1, max_retries=0, swallow_exceptions=False)
+
+# Zip codes practically never move, so geocoding results are kept on disk between runs.
+_CACHE_PATH = os.path.expanduser("~/.cache/zip2aq.sqlite")
+_GEOCODE_TTL = 30 * 24 * 60 * 60 # 30 days in seconds
+_cache_conn = None
+_cache_disabled = False
+_cache_lock = threading.Lock()
+
+# The on-disk cache is best effort: if it cannot be created, read or written, lookups fall back to the
+# in-memory caches only. Callers must hold _cache_lock.
+def _cache_connection():
+    global _cache_conn, _cache_disabled
+    if _cache_conn is None and not _cache_disabled:
+        try:
+            os.makedirs(os.path.dirname(_CACHE_PATH), exist_ok=True)
+            conn = sqlite3.connect(_CACHE_PATH, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, lat REAL, lon REAL, ts INTEGER)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS air_quality (key TEXT PRIMARY KEY, data TEXT, ts INTEGER)"
+            )
+            _cache_conn = conn
+        except (OSError, sqlite3.Error):
+            _cache_disabled = True
+    return _cache_conn
+
+def _cache_read(query, params):
+    with _cache_lock:
+        conn = _cache_connection()
+        if conn is None:
+            return None
+        try:
+            return conn.execute(query, params).fetchone()
+        except (OSError, sqlite3.Error):
+            return None
+
+def _cache_write(query, params):
+    with _cache_lock:
+        conn = _cache_connection()
+        if conn is None:
+            return
+        try:
+            with conn:
+                conn.execute(query, params)
+        except (OSError, sqlite3.Error):
+            pass
+
+'''
+_geocode(zip_code, country_code)
+
+Converts a zip code and country code into (latitude, longitude) using Nominatim.
+Results are memoized in-process and persisted to an SQLite cache at ~/.cache/zip2aq.sqlite for 30 days.
+
+Returns:
+    (lat, lon) (tuple): the coordinates of the location, or None if the location could not be found.
+'''
+@lru_cache(maxsize=4096)
+def _geocode(zip_code, country_code):
+    key = f"{zip_code}, {country_code}"
+    row = _cache_read("SELECT lat, lon, ts FROM geocode WHERE key = ?", (key,))
+    if row and time.time() - row[2] < _GEOCODE_TTL:
+        return row[0], row[1]
+
+    location = _rate_limited_geocode(key, timeout=5)
+    if not location:
+        return None
+
+    _cache_write(
+        "INSERT OR REPLACE INTO geocode (key, lat, lon, ts) VALUES (?, ?, ?, ?)",
+        (key, location.latitude, location.longitude, int(time.time())),
+    )
+    return location.latitude, location.longitude
+
+# Sensors often report the same reading repeatedly, so labels are memoized per (parameter, value).
+@lru_cache(maxsize=1024)
+def _quality_lut(parameter, value):
+    breakpoints, labels = _AQ_TABLE[parameter]
+    return labels[bisect_left(breakpoints, value)]
+
+def _classify(parameter, value, unit):
+    if parameter in _AQ_PARAMETERS:
+        return {"value": value, "unit": unit, "quality": _quality_lut(parameter, value)}
+    return {"value": value, "unit": unit}
+
 def pretty_print_dict(d):
     print(json.dumps(d, indent=4))
 
+# Queries the OpenAQ API directly; see get_air_quality below for the cached entry point.
+def _fetch_air_quality(lat, long):
+    url = "https://api.openaq.org/v2/latest"
+    params = {
+        "coordinates": f"{lat},{long}",
+        "radius": 10000, # Radius in meters
+        "limit": 1, # Limit to one result
+        "sort": "desc", # Sort by descending order
+        "parameter": list(_AQ_TABLE), # Only the pollutants we classify
+    }
+
+    response = _SESSION.get(url, params=params, timeout=(3.05, 10))
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+
+    if not data.get("results"):
+        return None
+
+    result = data["results"][0]
+
+    measurements = result["measurements"]
+
+    air_quality_data = {
+        "location": result["location"],
+        "city": result["city"],
+        "lastUpdated": measurements[0]["lastUpdated"],
+        "measurements": {m["parameter"]: _classify(m["parameter"], m["value"], m["unit"]) for m in measurements},
+        "AQI": None,
+    }
+
+    pm25 = air_quality_data["measurements"].get("pm25")
+    if pm25 is not None:
+        air_quality_data["AQI"] = {"value": pm25_to_aqi(pm25["value"]), "quality": pm25["quality"]}
+
+    return air_quality_data
+
+# OpenAQ measurements update roughly hourly and come from stations up to 10 km away, so results are reused for
+# 10 minutes per ~1.1 km grid cell (coordinates rounded to 2 decimals), in memory and in the on-disk cache.
+# Only the cache key is rounded; the OpenAQ request itself uses the exact coordinates.
+_AIR_QUALITY_TTL = 10 * 60 # 10 minutes in seconds
+_AIR_QUALITY_CACHE_SIZE = 2048
+_air_quality_cache = {}
+
+# Cached entries are never handed out directly; callers get a copy with fresh nested dicts they are free to modify.
+def _copy_air_quality_data(air_quality_data):
+    return {
+        **air_quality_data,
+        "measurements": {parameter: dict(measurement) for parameter, measurement in air_quality_data["measurements"].items()},
+        "AQI": dict(air_quality_data["AQI"]) if air_quality_data["AQI"] else None,
+    }
+
 '''
 get_air_quality(lat, long)
 
 This function retrieves the latest air quality data for a given latitude and longitude coordinates using the OpenAQ API.
+Only the pollutants that have a classification table (pm25, pm10, o3, no2) are requested.
 
 Args:
 lat: (float) representing the latitude of the location.
@@ -24,95 +219,52 @@ Returns:
     unit (str):         representing the unit of measurement.
     quality: (str)      representing the air quality index based on the measured value of the pollutant.
         - Possible values for quality are: Hazardous, Very Unhealthy, Unhealthy, Unhealthy for Sensitive Groups, Moderate, Good, Very Good.
+    AQI (dict):         the AQI estimated from the pm25 measurement (see pm25_to_aqi) and its quality, or None if there is no pm25 measurement.
 
 Note: If the function is unable to retrieve the air quality data from the OpenAQ API, it returns None.
+Results are cached for 10 minutes per coordinate rounded to 2 decimal places, in memory and (when writable) in ~/.cache/zip2aq.sqlite.
+Each call returns a new dictionary.
 '''
 def get_air_quality(lat, long):
-    url = "https://api.openaq.org/v1/latest"
-    params = {
-        "coordinates": f"{lat},{long}",
-        "radius": 10000, # Radius in meters
-        "limit": 1, # Limit to one result
-        "sort": "desc", # Sort by descending order
-    }
-
-    response = requests.get(url, params=params)
-    data = response.json()
-
-    if "results" not in data:
+    key = f"{round(lat, 2)},{round(long, 2)}"
+    now = time.time()
+
+    with _cache_lock:
+        cached = _air_quality_cache.get(key)
+    if cached and now - cached[1] < _AIR_QUALITY_TTL:
+        return _copy_air_quality_data(cached[0])
+
+    row = _cache_read("SELECT data, ts FROM air_quality WHERE key = ?", (key,))
+    if row and now - row[1] < _AIR_QUALITY_TTL:
+        air_quality_data = orjson.loads(row[0])
+        with _cache_lock:
+            _air_quality_cache[key] = (air_quality_data, row[1])
+        return _copy_air_quality_data(air_quality_data)
+
+    air_quality_data = _fetch_air_quality(lat, long)
+    if air_quality_data is None:
         return None
 
-    result = data["results"][0]
-
-    air_quality_data = {
-        "location": result["location"],
-        "city": result["city"],
-        "lastUpdated": result["measurements"][0]["lastUpdated"],
-        "measurements": {}
-    }
+    with _cache_lock:
+        if len(_air_quality_cache) >= _AIR_QUALITY_CACHE_SIZE:
+            del _air_quality_cache[next(iter(_air_quality_cache))]
+        _air_quality_cache[key] = (air_quality_data, now)
 
-    for measurement in result["measurements"]:
-        parameter = measurement["parameter"]
-        value = measurement["value"]
-        unit = measurement["unit"]
-        air_quality_data["measurements"][parameter] = {"value": value, "unit": unit}
-
-        if parameter == "pm25":
-            if value > 250.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Hazardous"
-            elif value > 150.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Very Unhealthy"
-            elif value > 55.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Unhealthy"
-            elif value > 35.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Unhealthy for Sensitive Groups"
-            elif value > 12.1:
-                air_quality_data["measurements"][parameter]["quality"] = "Moderate"
-            else:
-                air_quality_data["measurements"][parameter]["quality"] = "Good"
-        elif parameter == "pm10":
-            if value > 350.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Very Unhealthy"
-            elif value > 250.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Unhealthy"
-            elif value > 150.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Poor"
-            elif value > 55.5:
-                air_quality_data["measurements"][parameter]["quality"] = "Good"
-            else:
-                air_quality_data["measurements"][parameter]["quality"] = "Very Good"
-        elif parameter == "o3":
-            if value > 0.125:
-                air_quality_data["measurements"][parameter]["quality"] = "Very Unhealthy"
-            elif value > 0.095:
-                air_quality_data["measurements"][parameter]["quality"] = "Unhealthy"
-            elif value > 0.065:
-                air_quality_data["measurements"][parameter]["quality"] = "Moderate"
-            elif value > 0.035:
-                air_quality_data["measurements"][parameter]["quality"] = "Good"
-            else:
-                air_quality_data["measurements"][parameter]["quality"] = "Very Good"
-        elif parameter == "no2":
-            if value > 0.2:
-                air_quality_data["measurements"][parameter]["quality"] = "Very Unhealthy"
-            elif value > 0.1:
-                air_quality_data["measurements"][parameter]["quality"] = "Unhealthy"
-            elif value > 0.05:
-                air_quality_data["measurements"][parameter]["quality"] = "Moderate"
-            elif value > 0.025:
-                air_quality_data["measurements"][parameter]["quality"] = "Good"
-            else:
-                air_quality_data["measurements"][parameter]["quality"] = "Very Good"
+    _cache_write(
+        "INSERT OR REPLACE INTO air_quality (key, data, ts) VALUES (?, ?, ?)",
+        (key, orjson.dumps(air_quality_data).decode(), int(now)),
+    )
 
-    return air_quality_data
+    return _copy_air_quality_data(air_quality_data)
 
 '''
 get_air_quality_by_zip(zip_code: str, country_code: str) -> str
 
 This function retrieves the air quality data for a given zip code and country code. 
-It first uses the geopy library's geolocator to convert the zip code and country code into latitude and longitude coordinates. 
-If the location is invalid, the function returns an error message. Otherwise, the latitude and longitude coordinates are rounded to 3 decimal places, 
-and the get_air_quality() function is called to retrieve the air quality data for that location. The resulting data is then returned.
+It first uses the geopy library's geolocator to convert the zip code and country code into latitude and longitude coordinates
+(cached in memory and on disk, see _geocode). 
+If the location is invalid, the function returns an error message. Otherwise, 
+the get_air_quality() function is called to retrieve the air quality data for that location. The resulting data is then returned.
 
 Args:
     zip_code (str):     A string representing the zip code of the location.
@@ -123,14 +275,12 @@ Returns:
 '''
 def get_air_quality_by_zip(zip_code: str, country_code: str) -> str:
 
-    # get lat and long from zip code
-    geolocator = Nominatim(user_agent="geoapi")
-    location = geolocator.geocode(f"{zip_code}, {country_code}")
+    # get lat and long from zip code (cached)
+    location = _geocode(zip_code, country_code)
     if not location:
         return f"Invalid Zip code or Country code: {zip_code}, {country_code}"
 
-    # extract lat and long from geolocator instance and round to 3 decimal places
-    latitude, longitude = round(location.latitude,3), round(location.longitude,3)
+    latitude, longitude = location
 
     # retrieve the air_quality using openaq
     air_quality_data = get_air_quality(latitude, longitude)
@@ -140,7 +290,8 @@ def get_air_quality_by_zip(zip_code: str, country_code: str) -> str:
 '''
 pm25_to_aqi(pm25) and calc_aqi(Cp, Ih, Il, BPh, BPl)
 
-These functions approximate the AQI from the pm2.5 measurement. Typically AQI would be estimated by multiple pm2.5 measurements over a 24 hour period though, which makes this an estiamte.
+These functions approximate the AQI from the pm2.5 measurement. pm25_to_aqi uses the precomputed segment table in _aq_tables.py; 
+calc_aqi evaluates a single segment directly. Typically AQI would be estimated by multiple pm2.5 measurements over a 24 hour period though, which makes this an estiamte.
 
 Args:
     pm25 (float): A float representing the pm25 measurement
@@ -155,20 +306,8 @@ def pm25_to_aqi(pm25):
         return None
     elif pm25 > 500:
         return 500
-    elif pm25 > 350.5:
-        return calc_aqi(pm25, 500, 401, 500, 350.5)
-    elif pm25 > 250.5:
-        return calc_aqi(pm25, 400, 301, 350.4, 250.5)
-    elif pm25 > 150.5:
-        return calc_aqi(pm25, 300, 201, 250.4, 150.5)
-    elif pm25 > 55.5:
-        return calc_aqi(pm25, 200, 151, 150.4, 55.5)
-    elif pm25 > 35.5:
-        return calc_aqi(pm25, 150, 101, 55.4, 35.5)
-    elif pm25 > 12.1:
-        return calc_aqi(pm25, 100, 51, 35.4, 12.1)
-    elif pm25 >= 0:
-        return calc_aqi(pm25, 50, 0, 12, 0)
+    i = bisect_left(_AQI_BP, pm25)
+    return round(_AQI_SLOPE[i] * (pm25 - _AQI_BPL[i]) + _AQI_IL[i])
 
 def calc_aqi(Cp, Ih, Il, BPh, BPl):
     a = (Ih - Il)
@@ -177,8 +316,8 @@ def calc_aqi(Cp, Ih, Il, BPh, BPl):
     return round((a/b) * c + Il)
 
 """
-This function retrieves the air quality data by a given zip code and country code, calculates the AQI (Air Quality Index)
-for the pm25 measurement and returns all measurements along with the calculated AQI in a dictionary.
+This function retrieves the air quality data by a given zip code and country code and returns all measurements along with
+the AQI (Air Quality Index) calculated for the pm25 measurement in a dictionary.
 
 Args:
     zip_code (str): A string representing a zip code, default is "19406".
@@ -190,28 +329,114 @@ Returns:
 def get_air_quality_measurements_by_zip(zip_code="19406", country="US"):
     air_quality_data = get_air_quality_by_zip(zip_code, country)
 
-    location = air_quality_data['location']
+    return _flatten_measurements(air_quality_data)
 
+def _flatten_measurements(air_quality_data):
     measurements = air_quality_data['measurements']
+    measurements['AQI'] = air_quality_data['AQI']
+    measurements['location'] = air_quality_data['location']
 
-    AQI_package = None
+    return measurements
 
-    for AQtype in measurements:
-        value = measurements[AQtype]['value'] 
-        if AQtype == 'pm25':
-            AQI = pm25_to_aqi(value)
+"""
+This function retrieves the air quality measurements for many zip codes at once. The zip codes are geocoded one at a time
+(Nominatim allows at most 1 request per second, and results are cached), then the OpenAQ requests are made concurrently
+from a thread pool sharing the pooled HTTP session.
 
-            AQI_package = {'value': AQI, 'quality': measurements[AQtype]['quality']}
-    
-    measurements['AQI'] = AQI_package
-    measurements['location'] = location
+Args:
+    zip_codes (iterable): An iterable of strings representing zip codes.
+    country (str): A string representing a country code, default is "US".
+    max_workers (int): The maximum number of concurrent OpenAQ requests, default is 16.
 
-    return measurements
+Returns:
+    measurements (dict): A dictionary mapping each zip code to its measurements dictionary (see get_air_quality_measurements_by_zip),
+                         or to the error message / None returned by get_air_quality_by_zip if no data could be retrieved.
+                         A network or geocoder error for one zip code is stored as an error message for that zip code
+                         instead of failing the whole batch.
+"""
+def get_air_quality_measurements_by_zips(zip_codes, country="US", max_workers=16):
+    zip_codes = list(dict.fromkeys(zip_codes))
+
+    # geocode sequentially (rate limited to Nominatim's 1 request per second); the worker threads then only hit the cache
+    fetched = _geocode_zips(zip_codes, country)
+    pending = [zip_code for zip_code in zip_codes if zip_code not in fetched]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        fetched.update(zip(pending, pool.map(lambda zip_code: _get_air_quality_by_zip_or_error(zip_code, country), pending)))
+
+    return _measurements_by_zips(zip_codes, fetched)
+
+# The following helpers are shared by the thread pool and asyncio batch paths. Errors from a single zip code are
+# turned into an error message for that zip code so they don't discard the rest of the batch.
+_BATCH_ERRORS = (requests.RequestException, GeopyError, orjson.JSONDecodeError)
+
+def _batch_error(zip_code, country, error):
+    return f"Failed to retrieve air quality for {zip_code}, {country}: {error}"
+
+# Geocodes every zip code, returning {zip_code: error message} for the ones that failed.
+def _geocode_zips(zip_codes, country):
+    errors = {}
+    for zip_code in zip_codes:
+        try:
+            _geocode(zip_code, country)
+        except _BATCH_ERRORS as error:
+            errors[zip_code] = _batch_error(zip_code, country, error)
+    return errors
+
+def _get_air_quality_by_zip_or_error(zip_code, country):
+    try:
+        return get_air_quality_by_zip(zip_code, country)
+    except _BATCH_ERRORS as error:
+        return _batch_error(zip_code, country, error)
+
+def _measurements_by_zips(zip_codes, fetched):
+    return {
+        zip_code: _flatten_measurements(fetched[zip_code]) if isinstance(fetched[zip_code], dict) else fetched[zip_code]
+        for zip_code in zip_codes
+    }
+
+"""
+Async counterparts of get_air_quality and get_air_quality_measurements_by_zips, for callers that already run an event loop
+(e.g. a web server). The blocking requests calls run in worker threads so they keep using the pooled HTTP session and
+the caches, without blocking the event loop; max_concurrency bounds how many OpenAQ requests are in flight at once.
+
+Args:
+    zip_codes (iterable): An iterable of strings representing zip codes.
+    country (str): A string representing a country code, default is "US".
+    max_concurrency (int): The maximum number of concurrent OpenAQ requests, default is 16 (the session's pool size).
+
+Returns:
+    The same values as the corresponding synchronous functions.
+"""
+async def aget_air_quality(lat, long):
+    return await asyncio.to_thread(get_air_quality, lat, long)
+
+async def aget_air_quality_measurements_by_zips(zip_codes, country="US", max_concurrency=16):
+    zip_codes = list(dict.fromkeys(zip_codes))
+
+    # geocode sequentially (rate limited to Nominatim's 1 request per second); the fetches below then only hit the cache
+    fetched = await asyncio.to_thread(_geocode_zips, zip_codes, country)
+    pending = [zip_code for zip_code in zip_codes if zip_code not in fetched]
+
+    # a dedicated pool bounds the in-flight OpenAQ requests independently of the loop's default executor size.
+    # It is shut down without waiting so cancellation or an error never blocks the event loop on pending fetches.
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=max_concurrency)
+    try:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, _get_air_quality_by_zip_or_error, zip_code, country) for zip_code in pending)
+        )
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    fetched.update(zip(pending, results))
+
+    return _measurements_by_zips(zip_codes, fetched)
 
 ### Main Code ###
 
-# Get Air Quality measurements from a zip code
-AQ_measurements = get_air_quality_measurements_by_zip(zip_code="19406")
+if __name__ == "__main__":
+    # Get Air Quality measurements from a zip code
+    AQ_measurements = get_air_quality_measurements_by_zip(zip_code="19406")
 
-# Print the returned dictionary using a helper function (pretty_print_dict) Note: AQI means Air Quality Index 
-pretty_print_dict(AQ_measurements)
+    # Print the returned dictionary using a helper function (pretty_print_dict) Note: AQI means Air Quality Index 
+    pretty_print_dict(AQ_measurements)
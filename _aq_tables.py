@@ -0,0 +1,18 @@
+# Generated by scripts/gen_aq_tables.py from data/aq_breakpoints.csv and data/pm25_aqi_segments.csv. Do not edit.
+from array import array
+
+# parameter -> (ascending breakpoints, labels). A value strictly greater than the i-th breakpoint falls into labels[i + 1].
+AQ_TABLE = {
+    'pm25': (array('d', [12.1, 35.5, 55.5, 150.5, 250.5]), ('Good', 'Moderate', 'Unhealthy for Sensitive Groups', 'Unhealthy', 'Very Unhealthy', 'Hazardous')),
+    'pm10': (array('d', [55.5, 150.5, 250.5, 350.5]), ('Very Good', 'Good', 'Poor', 'Unhealthy', 'Very Unhealthy')),
+    'o3': (array('d', [0.035, 0.065, 0.095, 0.125]), ('Very Good', 'Good', 'Moderate', 'Unhealthy', 'Very Unhealthy')),
+    'no2': (array('d', [0.025, 0.05, 0.1, 0.2]), ('Very Good', 'Good', 'Moderate', 'Unhealthy', 'Very Unhealthy')),
+}
+
+AQ_PARAMETERS = frozenset(['pm25', 'pm10', 'o3', 'no2'])
+
+# PM2.5 AQI segments: lower breakpoints (excluding the first) to bisect, and per-segment BPl, Il and slope.
+AQI_BP = array('d', [12.1, 35.5, 55.5, 150.5, 250.5, 350.5])
+AQI_BPL = array('d', [0.0, 12.1, 35.5, 55.5, 150.5, 250.5, 350.5])
+AQI_IL = array('d', [0.0, 51.0, 101.0, 151.0, 201.0, 301.0, 401.0])
+AQI_SLOPE = array('d', [4.166666666666667, 2.103004291845494, 2.462311557788945, 0.5163329820864068, 0.990990990990991, 0.9909909909909912, 0.6622073578595318])
@@ -0,0 +1,77 @@
+'''
+gen_aq_tables.py
+
+Generates _aq_tables.py from the breakpoint CSVs in data/:
+    aq_breakpoints.csv:     parameter,upper_bound,label rows in ascending order per parameter. A value up to and including
+                            upper_bound gets that label; the last row of each parameter has an empty upper_bound.
+    pm25_aqi_segments.csv:  BPl,BPh,Il,Ih rows for the PM2.5 AQI segments in ascending order.
+
+The generated module holds the tables as literals (including the precomputed AQI slopes), so nothing is
+computed at import time. Run this script again after editing either CSV:
+
+    python scripts/gen_aq_tables.py
+'''
+import csv
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BREAKPOINTS_CSV = os.path.join(ROOT, "data", "aq_breakpoints.csv")
+SEGMENTS_CSV = os.path.join(ROOT, "data", "pm25_aqi_segments.csv")
+OUTPUT = os.path.join(ROOT, "_aq_tables.py")
+
+def read_breakpoints(path):
+    table = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            breakpoints, labels = table.setdefault(row["parameter"], ([], []))
+            if row["upper_bound"]:
+                breakpoints.append(float(row["upper_bound"]))
+            labels.append(row["label"])
+
+    for parameter, (breakpoints, labels) in table.items():
+        if breakpoints != sorted(breakpoints) or len(labels) != len(breakpoints) + 1:
+            raise ValueError(f"Invalid breakpoints for {parameter} in {path}")
+    return table
+
+def read_segments(path):
+    with open(path, newline="") as f:
+        segments = [tuple(float(row[k]) for k in ("BPl", "BPh", "Il", "Ih")) for row in csv.DictReader(f)]
+
+    if [s[0] for s in segments] != sorted(s[0] for s in segments):
+        raise ValueError(f"Segments in {path} are not in ascending order")
+    return segments
+
+def render(table, segments):
+    slopes = [(Ih - Il) / (BPh - BPl) for BPl, BPh, Il, Ih in segments]
+
+    lines = [
+        "# Generated by scripts/gen_aq_tables.py from data/aq_breakpoints.csv and data/pm25_aqi_segments.csv. Do not edit.",
+        "from array import array",
+        "",
+        "# parameter -> (ascending breakpoints, labels). A value strictly greater than the i-th breakpoint falls into labels[i + 1].",
+        "AQ_TABLE = {",
+    ]
+    for parameter, (breakpoints, labels) in table.items():
+        lines.append(f"    {parameter!r}: (array('d', {breakpoints!r}), {tuple(labels)!r}),")
+    lines += [
+        "}",
+        "",
+        f"AQ_PARAMETERS = frozenset({list(table)!r})",
+        "",
+        "# PM2.5 AQI segments: lower breakpoints (excluding the first) to bisect, and per-segment BPl, Il and slope.",
+        f"AQI_BP = array('d', {[s[0] for s in segments[1:]]!r})",
+        f"AQI_BPL = array('d', {[s[0] for s in segments]!r})",
+        f"AQI_IL = array('d', {[s[2] for s in segments]!r})",
+        f"AQI_SLOPE = array('d', {slopes!r})",
+        "",
+    ]
+    return "\n".join(lines)
+
+def main():
+    source = render(read_breakpoints(BREAKPOINTS_CSV), read_segments(SEGMENTS_CSV))
+    with open(OUTPUT, "w") as f:
+        f.write(source)
+    print(f"Wrote {OUTPUT}")
+
+if __name__ == "__main__":
+    main()